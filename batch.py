@@ -0,0 +1,283 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from PySide6.QtGui import QColor, QImage, QImageReader, QPainter, QPen
+from PySide6.QtCore import Qt, QPointF
+
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.bmp')
+
+USAGE_EPILOG = """
+Strokes are read from a JSON file holding a list of strokes, e.g.
+  [{"color": "#ffffff", "width": 5, "points": [[10, 10], [200, 80]]}]
+A stroke with a single point is painted as a point, otherwise as a
+line through each point, matching freehand painting on the canvas.
+
+Paths are streamed, so '-' can be used to read them from stdin.
+Images from a directory input are written to a subdirectory of the same
+name; files whose outputs would collide are reported as errors.
+"""
+
+def resized_image(image: QImage, w: int, h: int, bg: str) -> QImage:
+    """
+    Resize image, maintaining painting, as with Canvas.resized_pixmap
+    """
+    new_image = QImage(w, h, QImage.Format_ARGB32_Premultiplied)
+    new_image.fill(QColor(bg))
+    painter = QPainter(new_image)
+    painter.drawImage(0, 0, image)
+    painter.end()
+    return new_image
+
+def filled_image(image: QImage, bg: str) -> QImage:
+    """ Return image painted over a background color """
+    return resized_image(image, image.width(), image.height(), bg)
+
+def replay_strokes(image: QImage, strokes: list, aa: bool=True):
+    """ Paint recorded strokes onto image with the canvas's pen style """
+    painter = QPainter(image)
+    if aa:
+        painter.setRenderHint(QPainter.Antialiasing)
+    pen = QPen()
+    pen.setCapStyle(Qt.RoundCap)
+    pen.setJoinStyle(Qt.RoundJoin)
+    for stroke in strokes:
+        pen.setColor(QColor(stroke.get('color', 'white')))
+        pen.setWidth(int(stroke.get('width', 5)))
+        painter.setPen(pen)
+        points = [QPointF(x, y) for x, y in stroke['points']]
+        if len(points) == 1:
+            painter.drawPoint(points[0])
+        for start, end in zip(points, points[1:]):
+            painter.drawLine(start, end)
+    painter.end()
+
+def load_strokes(filename: str) -> list:
+    """ 
+    Return strokes read from JSON file, 
+    raising ValueError describing the first invalid one 
+    """
+    try:
+        with open(filename) as f:
+            strokes = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"cannot read strokes file {filename}: {e}")
+
+    if not isinstance(strokes, list):
+        raise ValueError("strokes file must hold a list of strokes")
+    for i, stroke in enumerate(strokes):
+        if not isinstance(stroke, dict):
+            raise ValueError(f"stroke {i} must be an object")
+        points = stroke.get('points')
+        if not isinstance(points, list) or not points:
+            raise ValueError(f"stroke {i} needs a non-empty 'points' list")
+        for point in points:
+            if (not isinstance(point, list) or len(point) != 2
+                or not all(isinstance(v, (int, float))
+                           and not isinstance(v, bool) for v in point)):
+                raise ValueError(
+                    f"stroke {i} has point {point!r}, expected [x, y]")
+        width = stroke.get('width', 5)
+        if not isinstance(width, int) or isinstance(width, bool) or width < 1:
+            raise ValueError(
+                f"stroke {i} has width {width!r}, expected positive int")
+        color = stroke.get('color', 'white')
+        if not isinstance(color, str) or not QColor.isValidColorName(color):
+            raise ValueError(f"stroke {i} has invalid color {color!r}")
+    return strokes
+
+def iter_paths(inputs):
+    """
+    Yield (path, output subdirectory) of images from files, directories
+    and '-' (stdin), without building the full list
+    """
+    for item in inputs:
+        if item == '-':
+            for line in sys.stdin:
+                if line.strip():
+                    yield line.strip(), ''
+        elif os.path.isdir(item):
+            subdir = os.path.basename(os.path.normpath(os.path.abspath(item)))
+            with os.scandir(item) as entries:
+                for entry in entries:
+                    if (entry.is_file()
+                        and entry.name.lower().endswith(IMAGE_SUFFIXES)):
+                        yield entry.path, subdir
+        else:
+            yield item, ''
+
+def output_path(path: str, subdir: str, output_dir: str, fmt: str) -> str:
+    """ Return path processed image of path is saved to """
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.normpath(
+        os.path.join(output_dir, subdir, f"{name}.{fmt}"))
+
+def init_worker(max_image_mb: int):
+    """
+    Bound memory a worker may allocate decoding a single image.
+    Resized images are checked against the same limit in process_file.
+    """
+    QImageReader.setAllocationLimit(max_image_mb)
+
+def process_file(path: str, output: str, options: dict) -> dict:
+    """
+    Open, resize, fill background, replay strokes and save a single file
+    to output. Runs in a worker process; returns a result dict instead 
+    of raising.
+    """
+    result = {'path': path, 'output': None, 'bytes': 0, 'pixels': 0,
+              'error': None}
+    try:
+        reader = QImageReader(path)
+        image = reader.read()
+        if image.isNull():
+            raise IOError(reader.errorString())
+        result['bytes'] = os.path.getsize(path)
+
+        if options['width'] or options['height']:
+            w = options['width'] or image.width()
+            h = options['height'] or image.height()
+            if w * h * 4 > options['max_image_mb'] * 1024 * 1024:
+                raise MemoryError(
+                    f"{w}x{h} exceeds --max-image-mb "
+                    f"{options['max_image_mb']}")
+            image = resized_image(image, w, h, options['bg'])
+        if options['fill']:
+            image = filled_image(image, options['bg'])
+        if options['strokes']:
+            image = image.convertToFormat(QImage.Format_ARGB32_Premultiplied)
+            replay_strokes(image, options['strokes'], options['aa'])
+
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        if not image.save(output, options['format'].upper(),
+                          options['quality']):
+            raise IOError(f"could not save {output}")
+        result['output'] = output
+        result['pixels'] = image.width() * image.height()
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+def create_parser() -> argparse.ArgumentParser:
+    """ Create argument parser for batch mode """
+    parser = argparse.ArgumentParser(
+        prog="night_painter batch",
+        description="Process images headlessly with the canvas operations.",
+        epilog=USAGE_EPILOG,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+',
+                        help="image files, directories, or '-' for stdin")
+    parser.add_argument('-o', '--output-dir', required=True,
+                        help="directory to write processed images to")
+    parser.add_argument('-f', '--format', default='png',
+                        choices=['png', 'jpg', 'jpeg', 'bmp'],
+                        help="output format (default: png)")
+    parser.add_argument('-q', '--quality', type=int, default=-1,
+                        help="output quality 0-100 (default: format default)")
+    parser.add_argument('--width', type=int, default=0,
+                        help="resize canvas to width, keeping painting")
+    parser.add_argument('--height', type=int, default=0,
+                        help="resize canvas to height, keeping painting")
+    parser.add_argument('--bg', default='#000000',
+                        help="background color (default: #000000)")
+    parser.add_argument('--fill', action='store_true',
+                        help="paint image over the background color")
+    parser.add_argument('--strokes',
+                        help="JSON file of recorded strokes to replay")
+    parser.add_argument('--no-aa', dest='aa', action='store_false',
+                        help="disable antialiasing when replaying strokes")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help="number of worker processes")
+    parser.add_argument('--max-image-mb', type=int, default=256,
+                        help="max memory per decoded image (default: 256)")
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="report each processed file")
+    return parser
+
+def main(argv=None) -> int:
+    """ Run batch mode, returning exit status """
+    parser = create_parser()
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.width < 0 or args.height < 0:
+        parser.error("--width and --height must not be negative")
+    if not -1 <= args.quality <= 100:
+        parser.error("--quality must be between 0 and 100")
+    if args.max_image_mb < 1:
+        parser.error("--max-image-mb must be at least 1")
+    if not QColor.isValidColorName(args.bg):
+        parser.error(f"--bg {args.bg!r} is not a valid color")
+
+    strokes = []
+    if args.strokes:
+        try:
+            strokes = load_strokes(args.strokes)
+        except ValueError as e:
+            parser.error(f"--strokes: {e}")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    options = {
+        'format': args.format,
+        'quality': args.quality,
+        'width': args.width,
+        'height': args.height,
+        'bg': args.bg,
+        'fill': args.fill,
+        'strokes': strokes,
+        'aa': args.aa,
+        'max_image_mb': args.max_image_mb,
+    }
+    # Output path -> input path, to catch files overwriting each other
+    outputs = {}
+
+    # Bound in-flight files so the path list is streamed, not materialized
+    max_pending = args.jobs * 4
+    pending = deque()
+    done, failed, total_bytes, total_pixels = 0, 0, 0, 0
+    start = time.perf_counter()
+
+    def collect(result):
+        nonlocal done, failed, total_bytes, total_pixels
+        if result['error']:
+            failed += 1
+            print(f"error: {result['path']}: {result['error']}",
+                  file=sys.stderr)
+            return
+        done += 1
+        total_bytes += result['bytes']
+        total_pixels += result['pixels']
+        if args.verbose:
+            print(f"{result['path']} -> {result['output']}")
+
+    with ProcessPoolExecutor(max_workers=args.jobs,
+                             initializer=init_worker,
+                             initargs=(args.max_image_mb,)) as executor:
+        for path, subdir in iter_paths(args.inputs):
+            output = output_path(
+                path, subdir, args.output_dir, args.format)
+            if output in outputs:
+                collect({'path': path, 'error':
+                         f"output {output} collides with {outputs[output]}"})
+                continue
+            outputs[output] = path
+            pending.append(
+                executor.submit(process_file, path, output, options))
+            if len(pending) >= max_pending:
+                collect(pending.popleft().result())
+        while pending:
+            collect(pending.popleft().result())
+
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(f"{done} processed, {failed} failed in {elapsed:.2f}s "
+          f"({done / elapsed:.1f} files/s, "
+          f"{total_bytes / elapsed / 1e6:.1f} MB/s in, "
+          f"{total_pixels / elapsed / 1e6:.1f} Mpx/s)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,20 @@
 from PySide6 import QtWidgets, QtGui
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QByteArray, QPoint, QRect, Signal
 from PySide6.QtGui import QColor, QImage
 from collections import deque
 
 class Canvas(QtWidgets.QLabel):
+    # Tools
+    TOOL_PEN = 'pen'
+    TOOL_LINE = 'line'
+    TOOL_RECT = 'rect'
+    TOOL_ELLIPSE = 'ellipse'
+    TOOL_EYEDROPPER = 'eyedropper'
+
+    # Eyedropper signals
+    color_hovered = Signal(QColor)
+    color_picked = Signal(QColor, bool) # color, True if primary
+
     def __init__(self, 
                  w: int, 
                  h: int, 
@@ -24,8 +35,19 @@ class Canvas(QtWidgets.QLabel):
 
         # Initializing useful variables 
         self.prev_x, self.prev_y = None, None
+        # Undo entries are either full pixmaps or (QPoint, QPixmap) patches;
+        # either pixmap may be kept as PNG data, decoded once undone
         self.pixmap_stack = deque([], self.max_undo)
 
+        # Shape in progress, previewed over the canvas until mouse release
+        self.tool = Canvas.TOOL_PEN
+        self.shape_start, self.shape_end = None, None
+        self.shape_color = None
+
+        # Eyedropper settings; image kept for sampling until pixmap replaced
+        self.sample_size = 1
+        self.sample_image = None
+
         # Pen settings
         self.primary_color = QtGui.QColor('white')
         self.secondary_color = self.canvas_bg_color
@@ -47,6 +69,16 @@ class Canvas(QtWidgets.QLabel):
         """ Set pen secondary color """
         self.secondary_color = QtGui.QColor(color)
 
+    def set_tool(self, tool):
+        """ Set tool used for painting """
+        self.tool = tool
+        # Eyedropper previews colors while hovering
+        self.setMouseTracking(tool == Canvas.TOOL_EYEDROPPER)
+
+    def set_sample_size(self, size):
+        """ Set eyedropper sample size, averaging size x size pixels """
+        self.sample_size = size
+
     def set_antialiasing(self, aa):
         """ Set antialiasing """
         self.antialiasing = aa
@@ -71,6 +103,14 @@ class Canvas(QtWidgets.QLabel):
         """ Return canvas height """
         return self.pixmap().height()
     
+    def get_tool(self):
+        """ Return tool used for painting """
+        return self.tool
+
+    def get_sample_size(self):
+        """ Return eyedropper sample size """
+        return self.sample_size
+
     def get_pen_size(self):
         """ Return pen size """
         return self.pen.width()
@@ -78,7 +118,64 @@ class Canvas(QtWidgets.QLabel):
     def get_max_undo(self):
         """ Return the max undo size """
         return self.max_undo
-    
+
+    def get_memory_usage(self) -> int:
+        """ Return approximate bytes used by pixmap and undo stack """
+        pixmaps = [entry[1] if isinstance(entry, tuple) else entry
+                   for entry in self.pixmap_stack] + [self.pixmap()]
+        if self.sample_image is not None:
+            pixmaps.append(self.sample_image)
+        return sum(p.size() if isinstance(p, QByteArray)
+                   else p.width() * p.height() * p.depth() // 8
+                   for p in pixmaps)
+
+    def setPixmap(self, pixmap):
+        super().setPixmap(pixmap)
+        # Sampling image no longer matches the pixmap
+        self.sample_image = None
+
+    def set_painted_pixmap(self, pixmap, rect):
+        """ 
+        Set pixmap that was only painted within rect, 
+        copying just that rect into the sampling image 
+        """
+        sample_image = self.sample_image
+        self.setPixmap(pixmap)
+        if sample_image is not None:
+            painter = QtGui.QPainter(sample_image)
+            painter.setCompositionMode(QtGui.QPainter.CompositionMode_Source)
+            painter.drawPixmap(rect, pixmap, rect)
+            painter.end()
+            self.sample_image = sample_image
+
+    def sample_color(self, x, y) -> QColor:
+        """ 
+        Return color at pos(x, y), averaged over sample size, 
+        or None if outside the canvas 
+        """
+        if self.sample_image is None:
+            # Kept in sync while painting, only rebuilt when replaced
+            self.sample_image = self.pixmap().toImage()
+        image = self.sample_image
+        if not image.valid(x, y):
+            return None
+        if self.sample_size <= 1:
+            return image.pixelColor(x, y)
+
+        half = self.sample_size // 2
+        x_range = range(max(0, x - half), min(image.width(), x + half + 1))
+        y_range = range(max(0, y - half), min(image.height(), y + half + 1))
+        r, g, b, a = 0, 0, 0, 0
+        for sy in y_range:
+            for sx in x_range:
+                color = image.pixelColor(sx, sy)
+                r += color.red()
+                g += color.green()
+                b += color.blue()
+                a += color.alpha()
+        n = len(x_range) * len(y_range)
+        return QColor(r // n, g // n, b // n, a // n)
+
     def open_image(self, image:QImage):
         self.pixmap_stack.append(self.pixmap())
         image_pixmap = QtGui.QPixmap.fromImage(image)
@@ -96,7 +193,8 @@ class Canvas(QtWidgets.QLabel):
         painter.setPen(self.pen)
         painter.drawPoint(x, y)
         painter.end()
-        self.setPixmap(current_pixmap)
+        self.set_painted_pixmap(
+            current_pixmap, self.shape_rect(QPoint(x, y), QPoint(x, y)))
 
     def draw_pen_line(self, start_x, start_y, x, y, color):
         """ 
@@ -111,7 +209,60 @@ class Canvas(QtWidgets.QLabel):
         painter.setPen(self.pen)
         painter.drawLine(start_x, start_y, x, y)
         painter.end()
-        self.setPixmap(current_pixmap)
+        self.set_painted_pixmap(
+            current_pixmap,
+            self.shape_rect(QPoint(start_x, start_y), QPoint(x, y)))
+
+    def draw_shape(self, painter, start, end, color):
+        """ 
+        Paint current tool's shape from start to end QPoints 
+        of specified color with painter 
+        """
+        if self.antialiasing:
+            painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        self.pen.setColor(color)
+        painter.setPen(self.pen)
+        if self.tool == Canvas.TOOL_LINE:
+            painter.drawLine(start, end)
+        elif self.tool == Canvas.TOOL_RECT:
+            painter.drawRect(QRect(start, end).normalized())
+        elif self.tool == Canvas.TOOL_ELLIPSE:
+            painter.drawEllipse(QRect(start, end).normalized())
+
+    def shape_rect(self, start, end) -> QRect:
+        """ Return rect covered by shape from start to end, including pen """
+        margin = self.pen.width() // 2 + 2
+        return QRect(start, end).normalized().adjusted(
+            -margin, -margin, margin, margin)
+
+    def commit_shape(self):
+        """ 
+        Rasterize shape in progress into the pixmap, recording only 
+        the affected rect for undo 
+        """
+        current_pixmap = self.pixmap()
+        rect = self.shape_rect(self.shape_start, self.shape_end).intersected(
+            current_pixmap.rect())
+        if not rect.isEmpty():
+            self.pixmap_stack.append(
+                (rect.topLeft(), current_pixmap.copy(rect)))
+            painter = QtGui.QPainter(current_pixmap)
+            self.draw_shape(
+                painter, self.shape_start, self.shape_end, self.shape_color)
+            painter.end()
+            self.set_painted_pixmap(current_pixmap, rect)
+        self.shape_start, self.shape_end = None, None
+
+    def paintEvent(self, e):
+        super().paintEvent(e)
+        # Preview shape in progress over the pixmap, only within the
+        # region being repainted
+        if self.shape_start is not None:
+            painter = QtGui.QPainter(self)
+            painter.setClipRect(e.rect())
+            self.draw_shape(
+                painter, self.shape_start, self.shape_end, self.shape_color)
+            painter.end()
 
     def resize_canvas(self, w:int, h:int):
         """ Resize canvas without resetting pixmaps """
@@ -132,6 +283,27 @@ class Canvas(QtWidgets.QLabel):
         self.prev_x = e.position().toPoint().x()
         self.prev_y = e.position().toPoint().y()
 
+        # Pick primary/secondary color based on left/right click
+        if self.tool == Canvas.TOOL_EYEDROPPER:
+            color = self.sample_color(self.prev_x, self.prev_y)
+            if color is not None and e.buttons() in (
+                    Qt.LeftButton, Qt.RightButton):
+                self.color_picked.emit(color, e.buttons() == Qt.LeftButton)
+            return
+
+        # Start shape of primary/secondary color based on left/right click
+        if self.tool != Canvas.TOOL_PEN:
+            if e.buttons() == Qt.LeftButton:
+                self.shape_color = self.primary_color
+            elif e.buttons() == Qt.RightButton:
+                self.shape_color = self.secondary_color
+            else:
+                return
+            self.shape_start = e.position().toPoint()
+            self.shape_end = self.shape_start
+            self.update(self.shape_rect(self.shape_start, self.shape_end))
+            return
+
         # Paint point of primary/secondary color based on left/right click
         if e.buttons() == Qt.LeftButton:
             self.pixmap_stack.append(self.pixmap())
@@ -145,6 +317,21 @@ class Canvas(QtWidgets.QLabel):
                                 self.secondary_color)
 
     def mouseMoveEvent(self, e):
+        if self.tool == Canvas.TOOL_EYEDROPPER:
+            color = self.sample_color(
+                e.position().toPoint().x(), e.position().toPoint().y())
+            if color is not None:
+                self.color_hovered.emit(color)
+            return
+
+        if self.shape_start is not None:
+            # Repaint only the area covered by the old and new preview
+            old_rect = self.shape_rect(self.shape_start, self.shape_end)
+            self.shape_end = e.position().toPoint()
+            self.update(old_rect.united(
+                self.shape_rect(self.shape_start, self.shape_end)))
+            return
+
         if self.prev_x is None: # First event
             self.prev_x = e.position().toPoint().x()
             self.prev_y = e.position().toPoint().y()
@@ -170,6 +357,9 @@ class Canvas(QtWidgets.QLabel):
         self.prev_y = e.position().toPoint().y()
             
     def mouseReleaseEvent(self, e):
+        if self.shape_start is not None:
+            self.commit_shape()
+
         # Reset previous positions
         self.prev_x, self.prev_y = None, None
 
@@ -179,9 +369,30 @@ class Canvas(QtWidgets.QLabel):
         most recent draw action 
         """
         try:
-            self.setPixmap(self.pixmap_stack.pop())
+            entry = self.pixmap_stack.pop()
         except IndexError: # IndexError can only occur if stack is empty,
-            pass           # therefore pass as we have reached undo limit 
+            return         # therefore return as we have reached undo limit 
+
+        if isinstance(entry, tuple): # Patch of affected rect only
+            pos, patch = entry
+            patch = self.decoded_pixmap(patch)
+            current_pixmap = self.pixmap()
+            painter = QtGui.QPainter(current_pixmap)
+            painter.setCompositionMode(
+                QtGui.QPainter.CompositionMode_Source)
+            painter.drawPixmap(pos, patch)
+            painter.end()
+            self.set_painted_pixmap(current_pixmap, QRect(pos, patch.size()))
+        else:
+            self.setPixmap(self.decoded_pixmap(entry))
+
+    def decoded_pixmap(self, pixmap) -> QtGui.QPixmap:
+        """ Return undo pixmap, decoding it if kept as PNG data """
+        if isinstance(pixmap, QByteArray):
+            data = pixmap
+            pixmap = QtGui.QPixmap()
+            pixmap.loadFromData(data, "PNG")
+        return pixmap
 
     def reset(self, bg=None):
         """ 
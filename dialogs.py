@@ -1,8 +1,13 @@
+import os
+
 from PySide6.QtWidgets import (
     QDialog, QDialogButtonBox, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
-    QColorDialog, QPushButton, QCheckBox)
-from PySide6.QtGui import QColor
-from PySide6.QtCore import Qt
+    QColorDialog, QPushButton, QCheckBox, QListView, QListWidget,
+    QListWidgetItem, QFileDialog, QSplitter, QWidget)
+from PySide6.QtGui import QColor, QIcon, QPixmap
+from PySide6.QtCore import Qt, QDir, QSize
+
+from thumbnails import IMAGE_SUFFIXES, ThumbnailCache, ThumbnailFileSystemModel
 
 class CanvasSizeDialog(QDialog):
     """
@@ -140,9 +145,38 @@ class PreferencesDialog(QDialog):
         aa_layout.addWidget(antialiasing_label)
         aa_layout.addWidget(self.antialiasing_check)
 
+        memory_label = QLabel("Document Memory:")
+        memory_mb_label = QLabel("MB")
+        self.memory_edit = QLineEdit()
+        self.memory_edit.setMaxLength(6)
+        self.memory_edit.setInputMask('000000')
+        self.memory_edit.setText(str(self.parent.memory_budget_mb))
+        self.memory_edit.editingFinished.connect(self.on_memory_edit_change)
+
+        memory_layout = QHBoxLayout()
+        memory_layout.addWidget(memory_label)
+        memory_layout.addWidget(self.memory_edit)
+        memory_layout.addWidget(memory_mb_label)
+
+        thumbnail_label = QLabel("Thumbnail Cache:")
+        thumbnail_mb_label = QLabel("MB")
+        self.thumbnail_edit = QLineEdit()
+        self.thumbnail_edit.setMaxLength(6)
+        self.thumbnail_edit.setInputMask('000000')
+        self.thumbnail_edit.setText(str(self.parent.thumbnail_cache_mb))
+        self.thumbnail_edit.editingFinished.connect(
+            self.on_thumbnail_edit_change)
+
+        thumbnail_layout = QHBoxLayout()
+        thumbnail_layout.addWidget(thumbnail_label)
+        thumbnail_layout.addWidget(self.thumbnail_edit)
+        thumbnail_layout.addWidget(thumbnail_mb_label)
+
         layout = QVBoxLayout()
         layout.addLayout(bg_layout)
-        layout.addLayout(aa_layout)        
+        layout.addLayout(aa_layout)
+        layout.addLayout(memory_layout)
+        layout.addLayout(thumbnail_layout)
         
         self.setLayout(layout)
 
@@ -159,4 +193,227 @@ class PreferencesDialog(QDialog):
     def on_antialiasing_check_change(self):
         """ Toggle antialiasing """
         self.parent.set_antialiasing(self.antialiasing_check.isChecked())
-            
\ No newline at end of file
+
+    def on_memory_edit_change(self):
+        """ 
+        Set memory budget of open documents, 
+        otherwise revert text to previous budget 
+        """
+        text = self.memory_edit.text()
+        if text == '' or int(text) == 0:
+            self.memory_edit.setText(str(self.parent.memory_budget_mb))
+        else:
+            self.parent.set_memory_budget_mb(int(text))
+
+    def on_thumbnail_edit_change(self):
+        """ 
+        Set thumbnail cache size cap, 
+        otherwise revert text to previous size 
+        """
+        text = self.thumbnail_edit.text()
+        if text == '' or int(text) == 0:
+            self.thumbnail_edit.setText(str(self.parent.thumbnail_cache_mb))
+        else:
+            self.parent.set_thumbnail_cache_mb(int(text))
+
+
+class OpenImageDialog(QDialog):
+    """
+    Dialog to open an image, with recent files and thumbnail previews.
+
+    parent -- Parent QWidget
+    cache -- ThumbnailCache providing thumbnails and metadata
+    """
+    def __init__(self, parent, cache: ThumbnailCache):
+        super().__init__(parent)
+
+        self.setWindowTitle("Open Image")
+        self.resize(900, 560)
+
+        # Helper variables
+        self.cache = cache
+        self.icon_size = QSize(96, 96)
+        self.preview_size = cache.thumbnail_size
+        self.selected_filename = None
+        self.cache.thumbnail_ready.connect(self.on_thumbnail_ready)
+
+        # Folder navigation
+        self.path_edit = QLineEdit()
+        self.path_edit.returnPressed.connect(self.on_path_edit_return)
+        up_btn = QPushButton("Up")
+        up_btn.clicked.connect(self.on_up_click)
+        browse_btn = QPushButton("Browse...")
+        browse_btn.clicked.connect(self.on_browse_click)
+
+        path_layout = QHBoxLayout()
+        path_layout.addWidget(self.path_edit)
+        path_layout.addWidget(up_btn)
+        path_layout.addWidget(browse_btn)
+
+        # Recent files
+        self.recent_list = QListWidget()
+        self.recent_list.setIconSize(QSize(48, 48))
+        self.recent_list.currentItemChanged.connect(self.on_recent_changed)
+        self.recent_list.itemActivated.connect(self.accept)
+
+        # Folder contents
+        self.model = ThumbnailFileSystemModel(cache, self)
+        self.model.setFilter(QDir.AllDirs | QDir.Files | QDir.NoDot)
+        self.model.setNameFilters(
+            [f"*.{suffix}" for suffix in IMAGE_SUFFIXES])
+        self.model.setNameFilterDisables(False)
+
+        self.folder_view = QListView()
+        self.folder_view.setModel(self.model)
+        self.folder_view.setViewMode(QListView.IconMode)
+        self.folder_view.setIconSize(self.icon_size)
+        self.folder_view.setGridSize(QSize(128, 128))
+        self.folder_view.setResizeMode(QListView.Adjust)
+        self.folder_view.setUniformItemSizes(True)
+        self.folder_view.setWordWrap(True)
+        self.folder_view.activated.connect(self.on_folder_activated)
+        self.folder_view.selectionModel().currentChanged.connect(
+            self.on_folder_changed)
+
+        # Preview
+        self.preview_label = QLabel()
+        self.preview_label.setFixedSize(self.preview_size, self.preview_size)
+        self.preview_label.setAlignment(Qt.AlignCenter)
+        self.info_label = QLabel()
+        self.info_label.setWordWrap(True)
+        self.info_label.setAlignment(Qt.AlignTop)
+
+        preview_layout = QVBoxLayout()
+        preview_layout.addWidget(self.preview_label)
+        preview_layout.addWidget(self.info_label, 1)
+        preview_widget = QWidget()
+        preview_widget.setLayout(preview_layout)
+
+        splitter = QSplitter()
+        splitter.addWidget(self.recent_list)
+        splitter.addWidget(self.folder_view)
+        splitter.addWidget(preview_widget)
+        splitter.setStretchFactor(1, 1)
+
+        # Buttons
+        buttons = QDialogButtonBox.Open | QDialogButtonBox.Cancel
+        self.button_box = QDialogButtonBox(buttons)
+        self.button_box.accepted.connect(self.on_open_click)
+        self.button_box.rejected.connect(self.reject)
+
+        layout = QVBoxLayout()
+        layout.addLayout(path_layout)
+        layout.addWidget(splitter, 1)
+        layout.addWidget(self.button_box)
+
+        self.setLayout(layout)
+
+    def get_filename(self) -> str:
+        """ Return selected image file """
+        return self.selected_filename
+
+    def get_directory(self) -> str:
+        """ Return directory currently browsed """
+        return self.path_edit.text()
+
+    def set_recent_files(self, recent_files: list):
+        """ Set recently used files, most recent first """
+        self.recent_list.clear()
+        for filename in recent_files:
+            if os.path.isfile(filename):
+                item = QListWidgetItem(os.path.basename(filename))
+                item.setData(Qt.UserRole, filename)
+                item.setToolTip(filename)
+                self.recent_list.addItem(item)
+                self.update_recent_icon(item)
+
+    def set_directory(self, directory: str):
+        """ Browse directory, dropping thumbnails queued for the last one """
+        if not os.path.isdir(directory):
+            directory = QDir.homePath()
+        self.cache.cancel_pending()
+        self.path_edit.setText(directory)
+        self.folder_view.setRootIndex(self.model.setRootPath(directory))
+
+    def on_path_edit_return(self):
+        """ Browse to typed directory """
+        self.set_directory(self.path_edit.text())
+
+    def on_up_click(self):
+        """ Browse to parent directory """
+        self.set_directory(os.path.dirname(self.get_directory()))
+
+    def on_browse_click(self):
+        """ Pick directory to browse """
+        directory = QFileDialog.getExistingDirectory(
+            self, "Browse", self.get_directory())
+        if directory:
+            self.set_directory(directory)
+
+    def on_folder_activated(self, index):
+        """ Enter directory, or open image """
+        if self.model.isDir(index):
+            self.set_directory(self.model.filePath(index))
+        else:
+            self.on_open_click()
+
+    def on_folder_changed(self, index):
+        """ Preview current file in folder view """
+        if index.isValid() and not self.model.isDir(index):
+            self.selected_filename = self.model.filePath(index)
+        else:
+            self.selected_filename = None
+        self.update_preview()
+
+    def on_recent_changed(self, item):
+        """ Preview current recent file """
+        self.selected_filename = item.data(Qt.UserRole) if item else None
+        self.update_preview()
+
+    def on_open_click(self):
+        """ Accept if a file is selected """
+        if self.selected_filename:
+            self.accept()
+
+    def on_thumbnail_ready(self, path):
+        """ Refresh preview and recent files once their thumbnail exists """
+        if path == self.selected_filename:
+            self.update_preview()
+        for row in range(self.recent_list.count()):
+            item = self.recent_list.item(row)
+            if item.data(Qt.UserRole) == path:
+                self.update_recent_icon(item)
+
+    def thumbnail(self, filename: str):
+        """ Return cached thumbnail of file, requesting it if missing """
+        key = self.cache.key_for_path(filename)
+        if key is None:
+            return None
+        image = self.cache.lookup(key)
+        if image is None:
+            self.cache.request(filename, key)
+        return image
+
+    def update_recent_icon(self, item):
+        """ Set thumbnail icon of recent file item """
+        image = self.thumbnail(item.data(Qt.UserRole))
+        if image is not None:
+            item.setIcon(QIcon(QPixmap.fromImage(image)))
+
+    def update_preview(self):
+        """ Show thumbnail and metadata of selected file """
+        self.preview_label.clear()
+        self.info_label.clear()
+        if not self.selected_filename:
+            return
+        image = self.thumbnail(self.selected_filename)
+        if image is None:
+            self.info_label.setText(os.path.basename(self.selected_filename))
+            return
+
+        self.preview_label.setPixmap(QPixmap.fromImage(image))
+        size_kb = os.path.getsize(self.selected_filename) / 1024
+        self.info_label.setText(
+            f"{os.path.basename(self.selected_filename)}\n"
+            f"{image.text('Width')} x {image.text('Height')} px\n"
+            f"{image.text('Format')}, {size_kb:.0f} KB")
@@ -0,0 +1,416 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PySide6 import QtGui
+from PySide6.QtCore import (
+    QBuffer, QByteArray, QIODevice, QObject, QTemporaryDir, Signal)
+
+from canvas import Canvas
+
+class Document:
+    """
+    A single open image: its canvas, undo history and associated file.
+
+    While inactive, a document's pixmaps can be compressed into memory
+    or evicted to disk, and are rehydrated when it becomes active again.
+    Compression and disk access run in a worker thread. Only the current
+    pixmap is decoded on rehydration; undo entries stay PNG data until
+    undone, and are reused as is when compressing again.
+
+    canvas -- Canvas holding the document's pixmap and undo stack
+    filename -- File associated with the document, if any
+    """
+    RESIDENT = 'resident'
+    COMPRESSING = 'compressing'
+    COMPRESSED = 'compressed'
+    EVICTING = 'evicting'
+    EVICTED = 'evicted'
+
+    png_quality = 80 # PNG 'quality' maps to zlib level; 80 is fast, lossless
+
+    def __init__(self, canvas: Canvas, filename: str=None):
+        self.canvas = canvas
+        self.filename = filename
+        self.state = Document.RESIDENT
+
+        # PNG data of pixmaps by QPixmap.cacheKey(), kept while resident
+        self.encoded = {}
+        # Keys of pixmaps being compressed, or PNG data of undo entries
+        # already compressed, oldest undo state first and current last
+        self.compress_keys = []
+        self.compress_job = 0
+        # Compressed pixmaps, same ordering as compress_keys
+        self.compressed_pixmaps = []
+        # Positions of undo patches, same ordering; None for full pixmaps
+        self.patch_positions = []
+        # Files holding compressed pixmaps while evicted, same ordering
+        self.evicted_files = []
+        self.evict_job = 0
+        # Files of undo entries being read back after rehydration
+        self.loading_files = []
+
+    def get_title(self) -> str:
+        """ Return title for tab, based on associated filename """
+        if self.filename:
+            return os.path.basename(self.filename)
+        return "Untitled"
+
+    def get_memory_usage(self) -> int:
+        """ Return approximate bytes held in memory by the document """
+        if self.state in (Document.RESIDENT, Document.COMPRESSING):
+            return self.canvas.get_memory_usage() + sum(
+                data.size() for data in self.encoded.values())
+        elif self.state in (Document.COMPRESSED, Document.EVICTING):
+            return sum(data.size() for data in self.compressed_pixmaps)
+        return 0
+
+    def get_projected_memory_usage(self) -> int:
+        """ 
+        Return approximate bytes held once work underway finishes,
+        counting only already encoded data for compressing documents 
+        """
+        if self.state == Document.COMPRESSING:
+            # Keys are either PNG data or keys of pixmaps maybe encoded
+            pixmaps = [self.encoded.get(key) if isinstance(key, int) else key
+                       for key in self.compress_keys]
+            return sum(data.size() for data in pixmaps if data is not None)
+        elif self.state == Document.EVICTING:
+            return 0
+        return self.get_memory_usage()
+
+    def start_compress(self, executor: ThreadPoolExecutor):
+        """
+        Start compressing current pixmap and undo stack in executor,
+        returning the Future of (job, {key: PNG data}) for pixmaps
+        not already encoded. The pixmaps stay on the canvas until
+        finish_compress() is called with the result.
+        """
+        if self.state != Document.RESIDENT or self.loading_files:
+            return None
+        entries = list(self.canvas.pixmap_stack) + [self.canvas.pixmap()]
+        self.patch_positions = [
+            entry[0] if isinstance(entry, tuple) else None
+            for entry in entries]
+        pixmaps = [entry[1] if isinstance(entry, tuple) else entry
+                   for entry in entries]
+        self.compress_keys = [
+            pixmap if isinstance(pixmap, QByteArray) else pixmap.cacheKey()
+            for pixmap in pixmaps]
+
+        # Drop data of undo entries that fell off the stack
+        self.encoded = {key: self.encoded[key] for key in self.compress_keys
+                        if isinstance(key, int) and key in self.encoded}
+        # QPixmap can only be used in the GUI thread, so encode QImages
+        images = {key: pixmap.toImage()
+                  for key, pixmap in zip(self.compress_keys, pixmaps)
+                  if isinstance(key, int) and key not in self.encoded}
+
+        self.compress_job += 1
+        self.state = Document.COMPRESSING
+        return executor.submit(self.encode_images, self.compress_job, images)
+
+    def encode_images(self, job: int, images: dict):
+        """ Return job and images losslessly compressed as PNG data """
+        return job, {key: self.compressed_image(image)
+                     for key, image in images.items()}
+
+    def finish_compress(self, job: int, encoded: dict):
+        """
+        Release the uncompressed pixmaps, if compression job is still
+        current, i.e. the document was not activated in the meantime
+        """
+        self.encoded.update(encoded)
+        if self.state != Document.COMPRESSING or job != self.compress_job:
+            return
+        self.compressed_pixmaps = [
+            self.encoded[key] if isinstance(key, int) else key
+            for key in self.compress_keys]
+        self.compress_keys = []
+        self.canvas.pixmap_stack.clear()
+        self.canvas.setPixmap(QtGui.QPixmap())
+        self.state = Document.COMPRESSED
+
+    def start_evict(self, directory: str, executor: ThreadPoolExecutor):
+        """
+        Start writing compressed pixmaps to files in directory in
+        executor, returning the Future of (job, filenames). The data
+        stays in memory until finish_evict() is called with the result.
+        """
+        if self.state != Document.COMPRESSED:
+            return None
+        prefix = os.path.join(directory, f"{id(self):x}-{self.evict_job}")
+        self.evict_job += 1
+        self.state = Document.EVICTING
+        return executor.submit(self.write_files, self.evict_job, prefix,
+                               list(self.compressed_pixmaps))
+
+    def write_files(self, job: int, prefix: str, pixmaps: list):
+        """ 
+        Return job and files PNG data was written to, 
+        or None if writing failed 
+        """
+        filenames = []
+        try:
+            for i, data in enumerate(pixmaps):
+                filenames.append(f"{prefix}-{i}.png")
+                with open(filenames[-1], 'wb') as f:
+                    f.write(data.data())
+        except OSError:
+            self.remove_files(filenames)
+            return job, None
+        return job, filenames
+
+    def finish_evict(self, job: int, filenames: list):
+        """
+        Release the compressed pixmaps, if eviction job is still
+        current, otherwise remove the files no longer needed
+        """
+        if self.state != Document.EVICTING or job != self.evict_job:
+            self.remove_files(filenames or [])
+            return
+        if filenames is None: # Keep in memory if files could not be written
+            self.state = Document.COMPRESSED
+            return
+        self.evicted_files = filenames
+        self.compressed_pixmaps = []
+        self.encoded = {}
+        self.state = Document.EVICTED
+
+    def rehydrate(self, executor: ThreadPoolExecutor):
+        """ 
+        Restore current pixmap and undo stack to the canvas. Undo entries
+        of evicted documents are read in executor, returning the Future 
+        of (job, PNG data) to pass to finish_rehydrate(), else None.
+        """
+        if self.state == Document.RESIDENT:
+            return None
+        if self.state == Document.COMPRESSING:
+            # Pixmaps were never released; result of the job is ignored
+            self.state = Document.RESIDENT
+            return None
+        if self.state == Document.EVICTING:
+            # Data is still in memory; files written are removed once done
+            self.evict_job += 1
+
+        future = None
+        if self.state == Document.EVICTED:
+            # Only the current pixmap is needed to show the document
+            with open(self.evicted_files[-1], 'rb') as f:
+                self.compressed_pixmaps = [QByteArray(f.read())]
+            self.remove_files(self.evicted_files[-1:])
+            self.loading_files = self.evicted_files[:-1]
+            self.evicted_files = []
+            if self.loading_files:
+                future = executor.submit(
+                    self.read_files, self.evict_job, self.loading_files)
+
+        current = QtGui.QPixmap()
+        current.loadFromData(self.compressed_pixmaps[-1], "PNG")
+        # Keep PNG data, keyed by the restored pixmap, for next compress
+        self.encoded = {current.cacheKey(): self.compressed_pixmaps[-1]}
+        if not self.loading_files:
+            self.canvas.pixmap_stack.extend(self.undo_entries(
+                self.patch_positions, self.compressed_pixmaps[:-1]))
+            self.patch_positions = []
+        self.compressed_pixmaps = []
+
+        self.canvas.setPixmap(current)
+        self.state = Document.RESIDENT
+        return future
+
+    def read_files(self, job: int, filenames: list):
+        """ 
+        Return job and PNG data read from files, removing them, 
+        or None if reading failed 
+        """
+        pixmaps = []
+        try:
+            for filename in filenames:
+                with open(filename, 'rb') as f:
+                    pixmaps.append(QByteArray(f.read()))
+        except OSError:
+            return job, None
+        self.remove_files(filenames)
+        return job, pixmaps
+
+    def finish_rehydrate(self, job: int, pixmaps: list):
+        """
+        Put undo entries read back from disk below any undo entries
+        added since rehydration; they are dropped if reading failed
+        """
+        if job != self.evict_job or not self.loading_files:
+            return
+        if pixmaps is not None:
+            newer = list(self.canvas.pixmap_stack)
+            self.canvas.pixmap_stack.clear()
+            self.canvas.pixmap_stack.extend(
+                self.undo_entries(self.patch_positions, pixmaps) + newer)
+        self.remove_files(self.loading_files)
+        self.loading_files = []
+        self.patch_positions = []
+
+    def undo_entries(self, positions: list, pixmaps: list) -> list:
+        """ Return undo stack entries of PNG data, left compressed """
+        return [data if pos is None else (pos, data)
+                for pos, data in zip(positions, pixmaps)]
+
+    def remove_files(self, filenames: list):
+        """ Remove files, ignoring those already removed """
+        for filename in filenames:
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+
+    def discard(self):
+        """ Remove any files left over from eviction """
+        self.remove_files(self.evicted_files + self.loading_files)
+        self.evicted_files = []
+        self.loading_files = []
+        self.compressed_pixmaps = []
+        self.patch_positions = []
+        self.encoded = {}
+
+    def compressed_image(self, image: QtGui.QImage) -> QByteArray:
+        """ Return image losslessly compressed as PNG data """
+        data = QByteArray()
+        buffer = QBuffer(data)
+        buffer.open(QIODevice.WriteOnly)
+        image.save(buffer, "PNG", self.png_quality)
+        buffer.close()
+        return data
+
+
+class DocumentManager(QObject):
+    """
+    Keeps track of open documents, keeping memory use of inactive
+    documents within a global budget.
+
+    Least recently used inactive documents are compressed first, in
+    background threads, then evicted to disk, also in the background,
+    if compressed documents still exceed the budget.
+
+    memory_budget -- Budget in bytes for all open documents
+    parent -- Parent QObject
+    """
+    # Emitted from worker threads, delivered in the GUI thread
+    compressed = Signal(object, int, object) # document, job, encoded data
+    evicted = Signal(object, int, object) # document, job, filenames
+    rehydrated = Signal(object, int, object) # document, job, undo data
+
+    def __init__(self, memory_budget: int, parent=None):
+        super().__init__(parent)
+        self.memory_budget = memory_budget
+        self.documents = [] # least recently used first
+        self.active_document = None
+        self.eviction_dir = QTemporaryDir()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, (os.cpu_count() or 2) - 1))
+        self.compressed.connect(self.on_compressed)
+        self.evicted.connect(self.on_evicted)
+        self.rehydrated.connect(self.on_rehydrated)
+
+    def set_memory_budget(self, memory_budget: int):
+        """ Set memory budget in bytes and enforce it """
+        self.memory_budget = memory_budget
+        self.enforce_budget()
+
+    def get_memory_budget(self) -> int:
+        """ Return memory budget in bytes """
+        return self.memory_budget
+
+    def get_memory_usage(self) -> int:
+        """ Return approximate bytes held by all documents """
+        return sum(doc.get_memory_usage() for doc in self.documents)
+
+    def get_projected_memory_usage(self) -> int:
+        """ Return approximate bytes held once compression finishes """
+        return sum(doc.get_projected_memory_usage() for doc in self.documents)
+
+    def add(self, document: Document):
+        """ Add document to the manager """
+        self.documents.append(document)
+
+    def remove(self, document: Document):
+        """ Remove document, cleaning up any evicted files """
+        self.documents.remove(document)
+        document.discard()
+        if document is self.active_document:
+            self.active_document = None
+
+    def activate(self, document: Document):
+        """ Rehydrate and mark document as active, then enforce budget """
+        self.active_document = document
+        # Move to end, as most recently used
+        self.documents.remove(document)
+        self.documents.append(document)
+        self.watch(document, document.rehydrate(self.executor),
+                   self.rehydrated)
+        self.enforce_budget()
+
+    def compress(self, document: Document):
+        """ Compress document in background """
+        self.watch(document, document.start_compress(self.executor),
+                   self.compressed)
+
+    def evict(self, document: Document):
+        """ Evict compressed document to disk in background """
+        self.watch(document, document.start_evict(
+            self.eviction_dir.path(), self.executor), self.evicted)
+
+    def watch(self, document: Document, future, signal: Signal):
+        """ Emit signal with document and job result once future is done """
+        if future is not None:
+            future.add_done_callback(
+                lambda f: self.on_job_done(document, f, signal))
+
+    def on_job_done(self, document: Document, future, signal: Signal):
+        """ Pass result of background job to the GUI thread """
+        if not future.cancelled() and future.exception() is None:
+            job, result = future.result()
+            signal.emit(document, job, result)
+
+    def on_compressed(self, document: Document, job: int, encoded: dict):
+        """ Release pixmaps of compressed document, then enforce budget """
+        if document not in self.documents:
+            return
+        document.finish_compress(job, encoded)
+        self.enforce_budget()
+
+    def on_evicted(self, document: Document, job: int, filenames: list):
+        """ Release compressed data of evicted document """
+        if document not in self.documents:
+            document.remove_files(filenames or [])
+            return
+        document.finish_evict(job, filenames)
+
+    def on_rehydrated(self, document: Document, job: int, pixmaps: list):
+        """ Restore undo entries read back from disk, then enforce budget """
+        if document not in self.documents:
+            return
+        document.finish_rehydrate(job, pixmaps)
+        self.enforce_budget()
+
+    def enforce_budget(self):
+        """
+        Compress, then evict, least recently used inactive documents
+        until memory usage is within budget
+        """
+        inactive = [doc for doc in self.documents
+                    if doc is not self.active_document]
+
+        for doc in inactive:
+            if self.get_projected_memory_usage() <= self.memory_budget:
+                return
+            if doc.state == Document.RESIDENT:
+                self.compress(doc)
+
+        # Documents still compressing are evicted once they finish
+        for doc in inactive:
+            if self.get_projected_memory_usage() <= self.memory_budget:
+                return
+            self.evict(doc)
+
+    def shutdown(self):
+        """ Wait for compression and disk access underway to finish """
+        self.executor.shutdown(wait=True, cancel_futures=True)
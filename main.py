@@ -1,13 +1,17 @@
+import sys
+
 from PySide6 import QtGui, QtWidgets
 from PySide6.QtWidgets import (
     QLabel, QColorDialog, QToolBar, QFileDialog, QLineEdit, 
-    QApplication)
+    QApplication, QTabWidget, QComboBox)
 from PySide6.QtGui import (
-    QAction, QIcon, QPixmap, QImage, QShortcut, QKeySequence)
-from PySide6.QtCore import Qt, QSize, QByteArray, QSettings
+    QAction, QActionGroup, QIcon, QPixmap, QImage, QShortcut, QKeySequence)
+from PySide6.QtCore import Qt, QSize, QByteArray, QSettings, QDir
 
 from canvas import Canvas
-from dialogs import CanvasSizeDialog, PreferencesDialog
+from documents import Document, DocumentManager
+from dialogs import CanvasSizeDialog, PreferencesDialog, OpenImageDialog
+from thumbnails import ThumbnailCache, default_cache_dir
 
 class NightPainterWindow(QtWidgets.QMainWindow):
     def __init__(self): # TODO: make init more functional
@@ -23,16 +27,26 @@ class NightPainterWindow(QtWidgets.QMainWindow):
         # Read config settings 
         self.readSettings()
 
-        # Create canvas 
-        self.createCanvas()
+        # Create document tabs with an initial canvas
+        self.createTabs()
 
         # Color picker dialog
+        # Signals connected once, and routed by which color is being picked
         self.color_picker = QColorDialog(self)
+        self.color_picker_primary = True
+        self.color_picker.currentColorChanged.connect(self.change_picker_color)
+        self.color_picker.colorSelected.connect(self.selected_picker_color)
+        self.color_picker.rejected.connect(self.cancel_picker_color)
 
         # File dialog
         self.file_dialog = QFileDialog(self)
         self.file_dialog.setNameFilter("Images (*.png *.jpg *.jpeg *.bmp)")
-        self.current_filename = None
+
+        # Open dialog, with recent files and cached thumbnails
+        self.thumbnail_cache = ThumbnailCache(
+            default_cache_dir(), self.thumbnail_cache_mb * 1024 * 1024,
+            parent=self)
+        self.open_dialog = OpenImageDialog(self, self.thumbnail_cache)
 
         # Color pixmaps
         self.primary_pixmap = QPixmap(16, 16)
@@ -49,13 +63,37 @@ class NightPainterWindow(QtWidgets.QMainWindow):
         # Hotkeys
         self.create_hotkeys()
 
-        self.setCentralWidget(self.canvas)
+        self.setCentralWidget(self.tabs)
         self.setFocusPolicy(Qt.FocusPolicy.ClickFocus)
 
     def set_antialiasing(self, aa):
         """ Set antialiasing """
         self.aa = aa
-        self.canvas.set_antialiasing(aa)
+        for document in self.document_manager.documents:
+            document.canvas.set_antialiasing(aa)
+
+    def set_memory_budget_mb(self, mb):
+        """ Set memory budget of open documents in MB """
+        self.memory_budget_mb = mb
+        self.document_manager.set_memory_budget(mb * 1024 * 1024)
+
+    def set_thumbnail_cache_mb(self, mb):
+        """ Set size cap of the thumbnail cache in MB """
+        self.thumbnail_cache_mb = mb
+        self.thumbnail_cache.set_max_bytes(mb * 1024 * 1024)
+
+    @property
+    def current_filename(self):
+        """ Return file associated with the active document """
+        return self.document_manager.active_document.filename
+
+    @current_filename.setter
+    def current_filename(self, filename):
+        """ Associate file with the active document, updating its tab """
+        document = self.document_manager.active_document
+        document.filename = filename
+        self.tabs.setTabText(self.tabs.currentIndex(), document.get_title())
+        self.tabs.setTabToolTip(self.tabs.currentIndex(), filename or "")
 
     def on_paste_click(self):
         """ Paste image from clipboard """
@@ -90,22 +128,75 @@ class NightPainterWindow(QtWidgets.QMainWindow):
                 canvas_size_dlg.get_height_int())
 
     def on_new_canvas_click(self):
-        """ Create new canvas """
-        self.canvas.reset(self.bg_color)
-        self.current_filename = None
+        """ Create new canvas in a new tab """
+        self.open_document()
 
     def on_open_click(self):
         """
         Open image from file, converting to pixmap and 
-        displaying on canvas.
+        displaying on canvas in a new tab.
         """
-        self.file_dialog.setAcceptMode(QFileDialog.AcceptOpen)
-        file_dialog_success = self.file_dialog.exec()
-
-        if file_dialog_success:
-            filename = self.file_dialog.selectedFiles()[0]
-            self.canvas.open_image(QImage(filename))
-            self.current_filename = filename
+        self.open_dialog.set_directory(self.open_directory)
+        self.open_dialog.set_recent_files(self.recent_files)
+        open_dialog_success = self.open_dialog.exec()
+        self.open_directory = self.open_dialog.get_directory()
+
+        if open_dialog_success:
+            filename = self.open_dialog.get_filename()
+            self.open_document(QImage(filename), filename)
+            self.add_recent_file(filename)
+
+    def add_recent_file(self, filename):
+        """ Move file to the front of recent files """
+        if filename in self.recent_files:
+            self.recent_files.remove(filename)
+        self.recent_files.insert(0, filename)
+        del self.recent_files[self.max_recent_files:]
+
+    def on_close_tab_click(self):
+        """ Close the active tab """
+        self.on_tab_close_requested(self.tabs.currentIndex())
+
+    def on_tab_close_requested(self, index):
+        """ 
+        Close document at tab index, 
+        replacing it with a new canvas if it was the last one 
+        """
+        canvas = self.tabs.widget(index)
+        document = self.document_for_canvas(canvas)
+        if self.tabs.count() == 1:
+            self.open_document()
+        self.document_manager.remove(document)
+        self.tabs.removeTab(self.tabs.indexOf(canvas))
+        canvas.deleteLater()
+
+    def on_tab_changed(self, index):
+        """ 
+        Rehydrate document of newly active tab, 
+        letting the manager compress or evict inactive ones 
+        """
+        if index < 0:
+            return
+        self.canvas = self.tabs.widget(index)
+        self.document_manager.activate(self.document_for_canvas(self.canvas))
+
+    def open_document(self, image:QImage=None, filename:str=None):
+        """ Create document in a new tab, optionally from image """
+        canvas = self.createCanvas()
+        if image is not None:
+            canvas.open_image(image)
+            canvas.pixmap_stack.clear() # nothing to undo in a fresh document
+        document = Document(canvas, filename)
+        self.document_manager.add(document)
+        index = self.tabs.addTab(canvas, document.get_title())
+        self.tabs.setTabToolTip(index, filename or "")
+        self.tabs.setCurrentIndex(index)
+
+    def document_for_canvas(self, canvas) -> Document:
+        """ Return the document owning canvas """
+        for document in self.document_manager.documents:
+            if document.canvas is canvas:
+                return document
 
     def on_save_click(self):
         """ 
@@ -126,78 +217,112 @@ class NightPainterWindow(QtWidgets.QMainWindow):
             filename = self.file_dialog.selectedFiles()[0]
             self.canvas.pixmap().save(filename)
             self.current_filename = filename
+            self.add_recent_file(filename)
 
     def on_primary_color_click(self):
         """ Open color picker to change primary color """
+        self.color_picker_primary = True
         self.color_picker.setCurrentColor(self.primary_color)
-        self.color_picker.currentColorChanged.connect(
-            self.change_primary_color)
-        self.color_picker.colorSelected.connect(
-            self.selected_primary_color)
-        self.color_picker.rejected.connect(
-            self.cancel_primary_color)
         self.color_picker.open()
 
-    def change_primary_color(self):
-        """ Dynamically primary color based on color picker choice """
-        self.primary_pixmap.fill(self.color_picker.currentColor())
-        self.action_primary_color.setIcon(self.primary_pixmap)
-
-    def selected_primary_color(self):
-        """ Change primary color, send to canvas, disconnect signals """
-        new_color = self.color_picker.currentColor()
-        self.primary_color = new_color
-        self.canvas.set_primary_color(new_color)
-        # Disconnect
-        self.disconnect_color_picker_signals()
-
-    def cancel_primary_color(self):
-        """ 
-        Cancel primary color selection, revert icon, disconnect signals 
-        """
-        self.primary_pixmap.fill(self.primary_color)
-        self.action_primary_color.setIcon(self.primary_pixmap)
-        # Disconnect
-        self.disconnect_color_picker_signals()
-
     def on_secondary_color_click(self):
         """ Open color picker to change secondary color """
+        self.color_picker_primary = False
         self.color_picker.setCurrentColor(self.secondary_color)
-        self.color_picker.currentColorChanged.connect(
-            self.change_secondary_color)
-        self.color_picker.colorSelected.connect(
-            self.selected_secondary_color)
-        self.color_picker.rejected.connect(
-            self.cancel_secondary_color)
         self.color_picker.open()
 
-    def change_secondary_color(self):
-        """ Dynamically secondary color based on color picker choice """
-        self.secondary_pixmap.fill(self.color_picker.currentColor())
+    def change_picker_color(self, color):
+        """ Dynamically update color icon based on color picker choice """
+        if self.color_picker_primary:
+            self.primary_pixmap.fill(color)
+            self.action_primary_color.setIcon(self.primary_pixmap)
+        else:
+            self.secondary_pixmap.fill(color)
+            self.action_secondary_color.setIcon(self.secondary_pixmap)
+
+    def selected_picker_color(self, color):
+        """ Change primary or secondary color to color picker choice """
+        if self.color_picker_primary:
+            self.set_primary_color(color)
+        else:
+            self.set_secondary_color(color)
+
+    def cancel_picker_color(self):
+        """ Cancel color selection, reverting icons """
+        self.primary_pixmap.fill(self.primary_color)
+        self.action_primary_color.setIcon(self.primary_pixmap)
+        self.secondary_pixmap.fill(self.secondary_color)
         self.action_secondary_color.setIcon(self.secondary_pixmap)
 
-    def selected_secondary_color(self):
-        """ Change secondary color, send to canvas, disconnect signals """
-        new_color = self.color_picker.currentColor()
-        self.secondary_color = new_color
-        self.canvas.set_secondary_color(new_color)
-        # Disconnect
-        self.disconnect_color_picker_signals()
+    def set_primary_color(self, color):
+        """ Change primary color, send to canvases, add to palette """
+        self.primary_color = QtGui.QColor(color)
+        for document in self.document_manager.documents:
+            document.canvas.set_primary_color(self.primary_color)
+        self.primary_pixmap.fill(self.primary_color)
+        self.action_primary_color.setIcon(self.primary_pixmap)
+        self.add_recent_color(self.primary_color)
 
-    def cancel_secondary_color(self):
-        """ 
-        Cancel secondary color selection, revert icon, disconnect signals 
-        """
-        self.secondary_pixmap.fill(self.secondary_color)   
+    def set_secondary_color(self, color):
+        """ Change secondary color, send to canvases, add to palette """
+        self.secondary_color = QtGui.QColor(color)
+        for document in self.document_manager.documents:
+            document.canvas.set_secondary_color(self.secondary_color)
+        self.secondary_pixmap.fill(self.secondary_color)
         self.action_secondary_color.setIcon(self.secondary_pixmap)
-        # Disconnect
-        self.disconnect_color_picker_signals()
+        self.add_recent_color(self.secondary_color)
+
+    def on_color_hovered(self, color):
+        """ Preview color under the eyedropper """
+        self.sample_pixmap.fill(color)
+        self.sample_swatch.setPixmap(self.sample_pixmap)
+        if color.alpha() < 255:
+            self.sample_label.setText(color.name(QtGui.QColor.HexArgb))
+        else:
+            self.sample_label.setText(color.name(QtGui.QColor.HexRgb))
 
-    def disconnect_color_picker_signals(self):
-        """ Disconnects in-use signals for the color picker """
-        self.color_picker.currentColorChanged.disconnect()
-        self.color_picker.colorSelected.disconnect()
-        self.color_picker.rejected.disconnect()
+    def on_color_picked(self, color, primary):
+        """ Set color picked with the eyedropper """
+        if primary:
+            self.set_primary_color(color)
+        else:
+            self.set_secondary_color(color)
+
+    def add_recent_color(self, color):
+        """ Move color to the front of the palette """
+        name = color.name(QtGui.QColor.HexArgb)
+        if name in self.recent_colors:
+            self.recent_colors.remove(name)
+        self.recent_colors.insert(0, name)
+        del self.recent_colors[self.max_recent_colors:]
+        self.update_palette()
+
+    def update_palette(self):
+        """ Fill palette actions with recent colors """
+        for i, action in enumerate(self.palette_actions):
+            if i < len(self.recent_colors):
+                pixmap = QPixmap(16, 16)
+                pixmap.fill(QtGui.QColor(self.recent_colors[i]))
+                action.setIcon(QIcon(pixmap))
+                action.setToolTip(self.recent_colors[i])
+                action.setVisible(True)
+            else:
+                action.setVisible(False)
+
+    def on_palette_click(self, i):
+        """ Set primary color from palette """
+        self.set_primary_color(QtGui.QColor(self.recent_colors[i]))
+
+    def on_sample_size_change(self, index):
+        """ Set eyedropper sample size of all canvases """
+        size = self.sample_size_combo.itemData(index)
+        for document in self.document_manager.documents:
+            document.canvas.set_sample_size(size)
+
+    def on_tool_change(self, tool):
+        """ Set painting tool of all canvases """
+        for document in self.document_manager.documents:
+            document.canvas.set_tool(tool)
 
     def on_pen_size_change(self):
         """ 
@@ -212,7 +337,8 @@ class NightPainterWindow(QtWidgets.QMainWindow):
         elif int(text) == 0:
             self.pen_size_edit.setText(str(prev_pen_size))
         else:
-            self.canvas.set_pen_size(int(text))
+            for document in self.document_manager.documents:
+                document.canvas.set_pen_size(int(text))
 
     def create_hotkeys(self):
         """ Create hotkeys """
@@ -220,7 +346,7 @@ class NightPainterWindow(QtWidgets.QMainWindow):
         undo_hotkey = QShortcut(
             QKeySequence(QKeySequence.StandardKey.Undo),
             self)
-        undo_hotkey.activated.connect(self.canvas.undo)
+        undo_hotkey.activated.connect(self.on_undo)
         # Save
         save_hotkey = QShortcut(
             QKeySequence(QKeySequence.StandardKey.Save),
@@ -241,6 +367,15 @@ class NightPainterWindow(QtWidgets.QMainWindow):
             QKeySequence(QKeySequence.StandardKey.Paste),
             self)
         paste_hotkey.activated.connect(self.on_paste_click)
+        # Close Tab
+        close_hotkey = QShortcut(
+            QKeySequence(QKeySequence.StandardKey.Close),
+            self)
+        close_hotkey.activated.connect(self.on_close_tab_click)
+
+    def on_undo(self):
+        """ Undo on the active canvas """
+        self.canvas.undo()
 
     def writeSettings(self):
         """ Write out settings/config """
@@ -259,6 +394,15 @@ class NightPainterWindow(QtWidgets.QMainWindow):
         settings.setValue("background_color", self.bg_color)
         settings.setValue("pen_size", self.canvas.get_pen_size())
         settings.setValue("antialiasing", self.aa)
+        settings.setValue("sample_size", self.canvas.get_sample_size())
+        settings.setValue("recent_colors", self.recent_colors)
+        settings.endGroup()
+        # Documents settings group
+        settings.beginGroup("Documents")
+        settings.setValue("memory_budget_mb", self.memory_budget_mb)
+        settings.setValue("recent_files", self.recent_files)
+        settings.setValue("open_directory", self.open_directory)
+        settings.setValue("thumbnail_cache_mb", self.thumbnail_cache_mb)
         settings.endGroup()
 
     def readSettings(self):
@@ -283,16 +427,50 @@ class NightPainterWindow(QtWidgets.QMainWindow):
         self.bg_color = settings.value("background_color", '#000000')
         self.init_pen_size = int(settings.value("pen_size", 5))
         self.aa = settings.value("antialiasing", True, type=bool)
+        self.sample_size = int(settings.value("sample_size", 1))
+        self.recent_colors = settings.value("recent_colors", [], type=list)
+        self.max_recent_colors = 12
+        settings.endGroup()
+        # Documents settings group
+        settings.beginGroup("Documents")
+        self.memory_budget_mb = int(settings.value("memory_budget_mb", 1024))
+        self.recent_files = settings.value("recent_files", [], type=list)
+        self.max_recent_files = 10
+        self.open_directory = settings.value(
+            "open_directory", QDir.homePath())
+        self.thumbnail_cache_mb = int(
+            settings.value("thumbnail_cache_mb", 256))
         settings.endGroup()
 
-    def createCanvas(self):
-        """ Create canvas """
-        self.canvas = Canvas(
+    def createCanvas(self) -> Canvas:
+        """ Create canvas using current settings """
+        canvas = Canvas(
             self.canvas_width, self.canvas_height, self.bg_color, self.aa)
-        self.canvas.set_primary_color(self.primary_color)
-        self.canvas.set_secondary_color(self.secondary_color)
-        self.canvas.set_pen_size(self.init_pen_size)
-        self.canvas.setAlignment(Qt.AlignLeft|Qt.AlignTop)
+        canvas.set_primary_color(self.primary_color)
+        canvas.set_secondary_color(self.secondary_color)
+        if hasattr(self, 'canvas'):
+            canvas.set_pen_size(self.canvas.get_pen_size())
+            canvas.set_tool(self.canvas.get_tool())
+            canvas.set_sample_size(self.canvas.get_sample_size())
+        else:
+            canvas.set_pen_size(self.init_pen_size)
+            canvas.set_sample_size(self.sample_size)
+        canvas.setAlignment(Qt.AlignLeft|Qt.AlignTop)
+        canvas.color_hovered.connect(self.on_color_hovered)
+        canvas.color_picked.connect(self.on_color_picked)
+        return canvas
+
+    def createTabs(self):
+        """ Create document tabs and open an initial canvas """
+        self.document_manager = DocumentManager(
+            self.memory_budget_mb * 1024 * 1024, self)
+        self.tabs = QTabWidget(self)
+        self.tabs.setDocumentMode(True)
+        self.tabs.setTabsClosable(True)
+        self.tabs.setMovable(True)
+        self.tabs.currentChanged.connect(self.on_tab_changed)
+        self.tabs.tabCloseRequested.connect(self.on_tab_close_requested)
+        self.open_document()
 
     def createActions(self):
         """ Create actions """
@@ -316,6 +494,11 @@ class NightPainterWindow(QtWidgets.QMainWindow):
         self.action_open.setStatusTip("Open Image from File")
         self.action_open.triggered.connect(self.on_open_click)
 
+        self.action_close_tab = QAction(
+            QIcon.fromTheme(QIcon.ThemeIcon.WindowClose), "&Close", self)
+        self.action_close_tab.setStatusTip("Close Current Tab")
+        self.action_close_tab.triggered.connect(self.on_close_tab_click)
+
         self.action_primary_color = QAction(
             QIcon(self.primary_pixmap),"Primary Color", self)
         self.action_primary_color.setStatusTip("Choose Primary Color")
@@ -351,6 +534,33 @@ class NightPainterWindow(QtWidgets.QMainWindow):
         self.action_open_preferences.setStatusTip("Open Settings Window")
         self.action_open_preferences.triggered.connect(
             self.on_preferences_click)
+
+        # Palette of recent colors
+        self.palette_actions = []
+        for i in range(self.max_recent_colors):
+            action = QAction(self)
+            action.setStatusTip("Set Primary Color from Palette")
+            action.triggered.connect(
+                lambda checked, i=i: self.on_palette_click(i))
+            self.palette_actions.append(action)
+
+        # Tools, only one of which can be checked at a time
+        self.tool_group = QActionGroup(self)
+        tools = [
+            (Canvas.TOOL_PEN, "Pen", "Paint Freehand"),
+            (Canvas.TOOL_LINE, "Line", "Draw Straight Line"),
+            (Canvas.TOOL_RECT, "Rect", "Draw Rectangle"),
+            (Canvas.TOOL_ELLIPSE, "Ellipse", "Draw Ellipse"),
+            (Canvas.TOOL_EYEDROPPER, "Pick", 
+             "Pick Color from Canvas (Left: Primary, Right: Secondary)")]
+        for tool, text, tip in tools:
+            action = QAction(text, self)
+            action.setStatusTip(tip)
+            action.setCheckable(True)
+            action.setChecked(tool == self.canvas.get_tool())
+            action.triggered.connect(
+                lambda checked, tool=tool: self.on_tool_change(tool))
+            self.tool_group.addAction(action)
         
     def createMenuAndToolbar(self):
         """ Create menu and toolbar """
@@ -366,6 +576,16 @@ class NightPainterWindow(QtWidgets.QMainWindow):
         self.pen_size_edit.setInputMask('000')
         self.pen_size_edit.editingFinished.connect(self.on_pen_size_change)
 
+        sample_size_label = QLabel("Sample:")
+        self.sample_size_combo = QComboBox(self)
+        self.sample_size_combo.setFocusPolicy(Qt.FocusPolicy.ClickFocus)
+        for size in (1, 3, 5, 9):
+            self.sample_size_combo.addItem(f"{size}x{size}", size)
+        self.sample_size_combo.setCurrentIndex(
+            max(0, self.sample_size_combo.findData(self.sample_size)))
+        self.sample_size_combo.currentIndexChanged.connect(
+            self.on_sample_size_change)
+
         # Menus
         menu = self.menuBar()
 
@@ -374,6 +594,7 @@ class NightPainterWindow(QtWidgets.QMainWindow):
         file_menu.addAction(self.action_save)
         file_menu.addAction(self.action_save_as)
         file_menu.addAction(self.action_open)
+        file_menu.addAction(self.action_close_tab)
 
         edit_menu = menu.addMenu("&Edit")
         edit_menu.addAction(self.action_copy)
@@ -390,20 +611,44 @@ class NightPainterWindow(QtWidgets.QMainWindow):
         self.toolbar.addAction(self.action_copy)
         self.toolbar.addAction(self.action_paste)
         self.toolbar.addSeparator()
+        self.toolbar.addActions(self.tool_group.actions())
+        self.toolbar.addSeparator()
         self.toolbar.addWidget(pen_size_label)
         self.toolbar.addWidget(self.pen_size_edit)
         self.toolbar.addWidget(pen_size_px_label)
         self.toolbar.addSeparator()
         self.toolbar.addAction(self.action_primary_color)
         self.toolbar.addAction(self.action_secondary_color)
+        self.toolbar.addSeparator()
+        self.toolbar.addWidget(sample_size_label)
+        self.toolbar.addWidget(self.sample_size_combo)
+        self.toolbar.addSeparator()
+        self.toolbar.addActions(self.palette_actions)
+        self.update_palette()
+
+        # Status bar, with eyedropper preview
+        self.sample_pixmap = QPixmap(16, 16)
+        self.sample_pixmap.fill(Qt.transparent)
+        self.sample_swatch = QLabel()
+        self.sample_swatch.setPixmap(self.sample_pixmap)
+        self.sample_label = QLabel()
+        self.statusBar().addPermanentWidget(self.sample_swatch)
+        self.statusBar().addPermanentWidget(self.sample_label)
 
     def closeEvent(self, e):
-        """ On close, write config settings """
+        """ On close, write config settings and stop thumbnail threads """
         self.writeSettings()
+        self.thumbnail_cache.shutdown()
+        self.document_manager.shutdown()
         return super().closeEvent(e)
 
 
 if __name__ == "__main__":
+    # Run headless batch mode if requested
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        import batch
+        sys.exit(batch.main(sys.argv[2:]))
+
     # Run app
     app = QApplication([])
     window = NightPainterWindow()
@@ -0,0 +1,233 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PySide6.QtWidgets import QFileSystemModel
+from PySide6.QtGui import QIcon, QImage, QImageReader, QPixmap
+from PySide6.QtCore import Qt, QObject, QStandardPaths, Signal
+
+IMAGE_SUFFIXES = ('png', 'jpg', 'jpeg', 'bmp')
+
+def default_cache_dir() -> str:
+    """ Return default on-disk thumbnail cache directory """
+    return os.path.join(
+        QStandardPaths.writableLocation(
+            QStandardPaths.StandardLocation.GenericCacheLocation),
+        "night-painter", "thumbnails")
+
+class ThumbnailCache(QObject):
+    """
+    Persistent thumbnail and metadata cache, keyed by path, mtime and size.
+
+    Thumbnails are generated by a background thread pool and kept on disk,
+    least recently used first out once the cache exceeds its size cap.
+
+    directory -- Directory to store thumbnails in
+    max_bytes -- Size cap of the on-disk cache
+    thumbnail_size -- Max width/height of thumbnails
+    """
+    thumbnail_ready = Signal(str) # path
+
+    max_memory_entries = 256 # decoded thumbnails kept for quick redraws
+
+    def __init__(self, directory: str, max_bytes: int,
+                 thumbnail_size: int=192, parent=None):
+        super().__init__(parent)
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.thumbnail_size = thumbnail_size
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.pending = {} # key -> Future of thumbnail being generated
+        self.cancellable = set() # pending keys dropped by cancel_pending
+        self.failed = set()
+        self.memory = OrderedDict() # key -> QImage, least recent first
+
+        # Index of on-disk thumbnails, key -> bytes, least recent first
+        entries = [e for e in os.scandir(self.directory)
+                   if e.is_file() and e.name.endswith('.png')]
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        self.index = OrderedDict(
+            (e.name[:-4], e.stat().st_size) for e in entries)
+        self.total_bytes = sum(self.index.values())
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(2, (os.cpu_count() or 2) - 1))
+
+    def set_max_bytes(self, max_bytes: int):
+        """ Set size cap of on-disk cache, evicting if over """
+        self.max_bytes = max_bytes
+        with self.lock:
+            self.evict()
+
+    def key(self, path: str, mtime: int, size: int) -> str:
+        """ Return cache key for path with modified time (ms) and size """
+        data = f"{os.path.abspath(path)}\0{mtime}\0{size}".encode()
+        return hashlib.sha1(data).hexdigest()
+
+    def key_for_path(self, path: str) -> str:
+        """ Return cache key for path, or None if path cannot be read """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return self.key(path, stat.st_mtime_ns // 1000000, stat.st_size)
+
+    def thumbnail_path(self, key: str) -> str:
+        """ Return on-disk file for key """
+        return os.path.join(self.directory, f"{key}.png")
+
+    def lookup(self, key: str) -> QImage:
+        """ Return cached thumbnail for key, or None if not cached """
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+            if key not in self.index:
+                return None
+            self.index.move_to_end(key)
+
+        filename = self.thumbnail_path(key)
+        image = QImage(filename)
+        if image.isNull():
+            return None
+        try:
+            os.utime(filename) # keep LRU order across sessions
+        except OSError:
+            pass
+        self.remember(key, image)
+        return image
+
+    def request(self, path: str, key: str, cancellable: bool=False):
+        """ 
+        Generate thumbnail for path in background, if not underway.
+        Cancellable requests, e.g. for a folder view, are dropped by
+        cancel_pending() if not yet started.
+        """
+        with self.lock:
+            if key in self.failed:
+                return
+            if key in self.pending:
+                if not cancellable:
+                    self.cancellable.discard(key)
+                return
+            self.pending[key] = self.executor.submit(
+                self.generate, path, key)
+            if cancellable:
+                self.cancellable.add(key)
+
+    def cancel_pending(self):
+        """ Drop queued cancellable requests, e.g. on leaving a folder """
+        with self.lock:
+            for key in self.cancellable:
+                if self.pending[key].cancel():
+                    del self.pending[key]
+            self.cancellable.clear()
+
+    def shutdown(self):
+        """ Drop queued requests and wait for running ones to finish """
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def generate(self, path: str, key: str):
+        """ Decode a scaled-down thumbnail of path, run in a pool thread """
+        reader = QImageReader(path)
+        reader.setAutoTransform(True)
+        size = reader.size()
+        # Decode at thumbnail size where the format supports it,
+        # avoiding a full decode of large images
+        if (size.isValid() and (size.width() > self.thumbnail_size
+                                or size.height() > self.thumbnail_size)):
+            reader.setScaledSize(size.scaled(
+                self.thumbnail_size, self.thumbnail_size, Qt.KeepAspectRatio))
+        image_format = bytes(reader.format()).decode().upper()
+        image = reader.read()
+        if image.isNull():
+            self.store_failed(key)
+            return
+
+        # Metadata is kept as PNG text alongside the thumbnail
+        image.setText("Width", str(size.width()))
+        image.setText("Height", str(size.height()))
+        image.setText("Format", image_format)
+        self.store(path, key, image)
+
+    def store(self, path: str, key: str, image: QImage):
+        """ Write thumbnail to disk and notify listeners """
+        filename = self.thumbnail_path(key)
+        temp_filename = f"{filename}.{threading.get_ident()}.tmp"
+        if image.save(temp_filename, "PNG"):
+            os.replace(temp_filename, filename)
+            with self.lock:
+                self.total_bytes -= self.index.pop(key, 0)
+                self.index[key] = os.path.getsize(filename)
+                self.total_bytes += self.index[key]
+                self.evict()
+        self.remember(key, image)
+        with self.lock:
+            self.pending.pop(key, None)
+            self.cancellable.discard(key)
+        self.thumbnail_ready.emit(path)
+
+    def store_failed(self, key: str):
+        """ Remember image could not be decoded, so it is not retried """
+        with self.lock:
+            self.pending.pop(key, None)
+            self.cancellable.discard(key)
+            self.failed.add(key)
+
+    def remember(self, key: str, image: QImage):
+        """ Keep decoded thumbnail in memory """
+        with self.lock:
+            self.memory[key] = image
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_memory_entries:
+                self.memory.popitem(last=False)
+
+    def evict(self):
+        """ Remove least recently used thumbnails until under size cap """
+        while self.total_bytes > self.max_bytes and self.index:
+            key, size = self.index.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self.thumbnail_path(key))
+            except OSError:
+                pass
+
+
+class ThumbnailFileSystemModel(QFileSystemModel):
+    """
+    File system model decorating image files with cached thumbnails,
+    requesting thumbnails only for the items views actually draw.
+
+    cache -- ThumbnailCache to read thumbnails from
+    parent -- Parent QObject
+    """
+    def __init__(self, cache: ThumbnailCache, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.cache.thumbnail_ready.connect(self.on_thumbnail_ready)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DecorationRole and index.column() == 0:
+            info = self.fileInfo(index)
+            if info.isFile() and info.suffix().lower() in IMAGE_SUFFIXES:
+                key = self.cache.key(
+                    info.absoluteFilePath(),
+                    info.lastModified().toMSecsSinceEpoch(),
+                    info.size())
+                image = self.cache.lookup(key)
+                if image is not None:
+                    return QIcon(QPixmap.fromImage(image))
+                self.cache.request(
+                    info.absoluteFilePath(), key, cancellable=True)
+        return super().data(index, role)
+
+    def on_thumbnail_ready(self, path):
+        """ Redraw item of newly generated thumbnail """
+        index = self.index(path)
+        if index.isValid():
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])